@@ -1,16 +1,22 @@
 
 
 import os
-import json
-from typing import Any, Dict, Iterable, List, Optional
+import re
+import time
+import queue
+import threading
+import hashlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import orjson
 import requests
 from requests import Session
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill
+import xlsxwriter
 
 # --------------------------
 # Env & constants
@@ -18,6 +24,8 @@ from openpyxl.styles import Font, PatternFill
 load_dotenv()
 OZON_CLIENT_ID = os.getenv("OZON_CLIENT_ID") or os.getenv("CLIENT_ID")
 OZON_API_KEY = os.getenv("OZON_API_KEY") or os.getenv("CLIENT_TOKEN") or os.getenv("API_KEY")
+# дисковый кэш каталога и кластеров включается явно: OZON_CACHE=1
+OZON_CACHE = (os.getenv("OZON_CACHE") or "").strip().lower() in ("1", "true", "yes")
 
 API_URL = "https://api-seller.ozon.ru"
 DEFAULT_TIMEOUT = 30
@@ -26,6 +34,18 @@ MAX_INFO_BATCH = 1000
 MAX_STOCK_BATCH = 100
 MAX_ORDER_PAGE = 1000
 MAX_OFFSET = 20000
+ORDER_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+ORDER_QUEUE_PAGES = 2  # страниц заказов в буфере на один интервал
+MAX_WORKERS = 32
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = 64
+CACHE_DIR = ".ozon_cache"
+# TTL дискового кэша (сек) для редко меняющихся справочников
+CACHE_TTL = {
+    "v3/product/list": 60 * 60,
+    "v3/product/info/list": 60 * 60,
+    "v1/cluster/list": 24 * 60 * 60,
+}
 
 class OzonApiError(RuntimeError):
     pass
@@ -42,28 +62,69 @@ def _require_env(var_value: Optional[str], var_name: str) -> str:
 # OzonClient
 # --------------------------
 class OzonClient:
-    def __init__(self, client_id: str, api_key: str, base_url: str = API_URL):
+    def __init__(self, client_id: str, api_key: str, base_url: str = API_URL,
+                 cache_ttl: Optional[Dict[str, int]] = None, cache_dir: str = CACHE_DIR):
         self.base_url = base_url.rstrip("/")
+        self.cache_ttl = cache_ttl or {}
+        self.cache_dir = cache_dir
+        self._memo: Dict[str, Any] = {}
         self.session: Session = requests.Session()
         retry = Retry(total=5, backoff_factor=0.8, status_forcelist=(429,500,502,503,504),
                       allowed_methods=("POST",), raise_on_status=False)
-        adapter = HTTPAdapter(max_retries=retry)
+        # пул должен вмещать все параллельные запросы, иначе urllib3 будет их сериализовать
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
         self.headers = {"Client-Id": client_id, "Api-Key": api_key, "Content-Type": "application/json"}
 
     def _post(self, endpoint: str, payload: Dict[str, Any]) -> Any:
+        ttl = self.cache_ttl.get(endpoint.lstrip("/"))
+        if ttl is None:
+            return self._request(endpoint, payload)
+
+        # ключ привязан к аккаунту и адресу API, чтобы не отдать данные другого продавца
+        key_source = f"{self.base_url}|{self.headers['Client-Id']}|{endpoint}:".encode()
+        key = hashlib.sha1(key_source + orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        if key in self._memo:
+            return self._memo[key]
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        data = self._read_cache(path, ttl)
+        if data is None:
+            data = self._request(endpoint, payload)
+            self._write_cache(path, data)
+        self._memo[key] = data
+        return data
+
+    @staticmethod
+    def _read_cache(path: str, ttl: int) -> Any:
+        try:
+            if time.time() - os.path.getmtime(path) > ttl:
+                return None
+            with open(path, "rb") as f:
+                return orjson.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, path: str, data: Any) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(data))
+        os.replace(tmp_path, path)
+
+    def _request(self, endpoint: str, payload: Dict[str, Any]) -> Any:
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
-        resp = self.session.post(url, headers=self.headers, json=payload, timeout=DEFAULT_TIMEOUT)
+        # orjson быстрее stdlib json и в кодировании, и в разборе; Content-Type уже в self.headers
+        resp = self.session.post(url, headers=self.headers, data=orjson.dumps(payload), timeout=DEFAULT_TIMEOUT)
         try:
             resp.raise_for_status()
         except requests.HTTPError as e:
-            try: message = resp.json()
+            try: message = orjson.loads(resp.content)
             except: message = resp.text
             raise OzonApiError(f"HTTP error {resp.status_code} on {endpoint}: {message}") from e
         try:
-            return resp.json()
-        except json.JSONDecodeError as e:
+            return orjson.loads(resp.content)
+        except orjson.JSONDecodeError as e:
             raise OzonApiError(f"Invalid JSON from {endpoint}: {resp.text[:300]}") from e
 
     # --- Products / Stocks ---
@@ -87,12 +148,13 @@ class OzonClient:
 
     def get_product_info(self, product_ids: Iterable[int]) -> List[Dict[str, Any]]:
         ids = list(product_ids)
+        chunks = [ids[i:i+MAX_INFO_BATCH] for i in range(0, len(ids), MAX_INFO_BATCH)]
         out: List[Dict[str, Any]] = []
-        for i in range(0, len(ids), MAX_INFO_BATCH):
-            chunk = ids[i:i+MAX_INFO_BATCH]
-            data = self._post("v3/product/info/list", {"product_id": chunk})
-            items = data.get("result", {}).get("items") or data.get("items") or []
-            out.extend(items if isinstance(items,list) else [])
+        # пачки независимы — запрашиваем параллельно, map сохраняет порядок
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+            for data in ex.map(lambda chunk: self._post("v3/product/info/list", {"product_id": chunk}), chunks):
+                items = data.get("result", {}).get("items") or data.get("items") or []
+                out.extend(items if isinstance(items,list) else [])
         return out
 
     def get_stocks(self, skus: Iterable[int], warehouse_ids: Iterable[int]) -> List[Dict[str, Any]]:
@@ -103,97 +165,232 @@ class OzonClient:
 
     # --- Orders ---
     def get_orders(self, since, to) -> List[Dict[str, Any]]:
-        orders: List[Dict[str, Any]] = []
+        return list(self.iter_orders(since, to))
 
+    def iter_orders(self, since, to) -> Iterator[Dict[str, Any]]:
         # разбиваем период на интервалы, чтобы не превысить MAX_OFFSET
+        windows = []
         current_since = since
         while current_since < to:
             current_to = min(to, current_since + timedelta(days=30))  # берем максимум 1 месяц
-            offset = 0
+            windows.append((current_since, current_to))
+            # двигаем период на следующий месяц
+            current_since = current_to
 
-            while True:
-                payload = {
-                    "dir": "asc",
-                    "filter": {
-                        "since": current_since.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-                        "to": current_to.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-                    },
-                    "limit": MAX_ORDER_PAGE,
-                    "offset": offset,
-                    "translit": True,
-                    "with": {
-                        "analytics_data": True,
-                        "financial_data": True,
-                        "legal_info": False
-                    }
+        # Интервалы независимы — каждый загружается в своём потоке и кладёт страницы
+        # в общую ограниченную очередь. Поток интервала ждёт, пока очередь заполнена,
+        # поэтому в памяти не больше O(интервалов × страница) заказов, а не весь период.
+        # Порядок заказов между интервалами не сохраняется.
+        if not windows:
+            return
+        pages: "queue.Queue[Tuple[str, Any]]" = queue.Queue(maxsize=len(windows) * ORDER_QUEUE_PAGES)
+        stop = threading.Event()
+
+        def put(item: Tuple[str, Any]) -> bool:
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce(current_since, current_to) -> None:
+            window_pages = self._iter_orders_window(current_since, current_to)
+            try:
+                for page in window_pages:
+                    if not put(("page", page)):
+                        return
+            except Exception as e:
+                put(("error", e))
+            finally:
+                window_pages.close()
+                put(("done", None))
+
+        ex = ThreadPoolExecutor(max_workers=len(windows))
+        try:
+            for window in windows:
+                ex.submit(produce, *window)
+            remaining = len(windows)
+            while remaining:
+                kind, value = pages.get()
+                if kind == "done":
+                    remaining -= 1
+                elif kind == "error":
+                    raise value
+                else:
+                    yield from value
+        finally:
+            # потребитель закончил или прервался — останавливаем потоки интервалов
+            stop.set()
+            ex.shutdown(wait=False, cancel_futures=True)
+
+    def _iter_orders_window(self, current_since, current_to) -> Iterator[List[Dict[str, Any]]]:
+        # границы интервала одинаковы для всех страниц — форматируем один раз
+        since_str = current_since.astimezone(timezone.utc).strftime(ORDER_DATE_FORMAT)
+        to_str = current_to.astimezone(timezone.utc).strftime(ORDER_DATE_FORMAT)
+
+        def fetch_page(offset: int) -> Any:
+            payload = {
+                "dir": "asc",
+                "filter": {
+                    "since": since_str,
+                    "to": to_str,
+                },
+                "limit": MAX_ORDER_PAGE,
+                "offset": offset,
+                "translit": True,
+                "with": {
+                    "analytics_data": True,
+                    "financial_data": True,
+                    "legal_info": False
                 }
+            }
+            return self._post("v2/posting/fbo/list", payload)
 
-                data = self._post("v2/posting/fbo/list", payload)
+        offset = 0
+
+        # offset растёт на MAX_ORDER_PAGE, пока страницы полные, поэтому следующую страницу
+        # запрашиваем заранее, пока ждём и разбираем текущую; если текущая окажется
+        # последней, лишний ответ просто отбрасывается
+        ex = ThreadPoolExecutor(max_workers=2)
+        try:
+            pending = ex.submit(fetch_page, offset)
+            while True:
+                next_offset = offset + MAX_ORDER_PAGE
+                prefetch = ex.submit(fetch_page, next_offset) if next_offset < MAX_OFFSET else None
+
+                data = pending.result()
 
                 # по документации result — это список, а не объект
                 result = data.get("result", [])
                 if not isinstance(result, list) or not result:
                     break
 
-                orders.extend(result)
                 offset += len(result)
+                yield result
 
                 if len(result) < MAX_ORDER_PAGE or offset >= MAX_OFFSET:
                     # если меньше лимита или достигнут max offset, выходим
                     break
-
-            # двигаем период на следующий месяц
-            current_since = current_to
-
-        return orders
+                pending = prefetch
+        finally:
+            ex.shutdown(wait=False, cancel_futures=True)
 
 
 # --------------------------
 # Gather inventory
 # --------------------------
+class ProductMeta(NamedTuple):
+    """Названия и артикулы товаров параллельными списками; позиция SKU — sku_to_idx[sku]."""
+    sku_to_idx: Dict[int, int]
+    names: List[str]
+    offer_ids: List[str]
+
 def gather_inventory_by_warehouses(client: OzonClient):
-    product_list = client.list_products(visibility="IN_SALE")
-    product_ids = [p.get("product_id") for p in product_list if "product_id" in p]
-    info_items = client.get_product_info(product_ids)
-    skus: List[int] = []
-    product_meta: Dict[int, Dict[str, Any]] = {}
+    # кластеры не зависят от товаров — загружаем их параллельно с каталогом
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        clusters_future = ex.submit(client.list_clusters)
+        product_list = client.list_products(visibility="IN_SALE")
+        product_ids = [p.get("product_id") for p in product_list if "product_id" in p]
+        info_items = client.get_product_info(product_ids)
+        clusters = clusters_future.result()
+    product_meta = ProductMeta({}, [], [])
     for it in info_items:
         sku = it.get("sku")
         if sku is None: continue
-        skus.append(int(sku))
-        product_meta[int(sku)] = {"name": it.get("name",""), "offer_id": it.get("offer_id","")}
-
-    clusters = client.list_clusters()
-    warehouses: List[Dict[str, Any]] = []
+        idx = product_meta.sku_to_idx.get(int(sku))
+        if idx is not None:
+            # повтор SKU: как и раньше, побеждает последняя запись
+            product_meta.names[idx] = it.get("name","")
+            product_meta.offer_ids[idx] = it.get("offer_id","")
+            continue
+        product_meta.sku_to_idx[int(sku)] = len(product_meta.names)
+        product_meta.names.append(it.get("name",""))
+        product_meta.offer_ids.append(it.get("offer_id",""))
+    skus = list(product_meta.sku_to_idx)
+
+    # один склад может входить в несколько логистических кластеров — убираем дубли
+    wh_by_id: Dict[int, Dict[str, Any]] = {}
     for cl in clusters:
         for lc in cl.get("logistic_clusters", []) or []:
-            warehouses.extend(lc.get("warehouses", []) or [])
-
-    inventory: Dict[int, Dict[int, Dict[str,int]]] = {}
-    for wh in warehouses:
-        wh_id = wh.get("warehouse_id") or wh.get("id")
-        if wh_id is None: continue
-        for i in range(0, len(skus), MAX_STOCK_BATCH):
-            batch = skus[i:i+MAX_STOCK_BATCH]
-            stock_items = client.get_stocks(batch, [int(wh_id)])
-            for item in stock_items:
+            for wh in lc.get("warehouses", []) or []:
+                wh_id = wh.get("warehouse_id") or wh.get("id")
+                if wh_id is None: continue
+                wh_by_id.setdefault(int(wh_id), wh)
+    all_wh_ids = list(wh_by_id)
+
+    # Эндпоинт принимает список складов: один запрос на пачку SKU сразу по всем складам,
+    # пачки запрашиваем параллельно
+    # (sku, warehouse_id) -> (в наличии, в пути, в заявке)
+    inventory: Dict[Tuple[int, int], Tuple[int, int, int]] = {}
+    if not all_wh_ids:
+        return inventory, product_meta, clusters
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = [
+            ex.submit(client.get_stocks, skus[i:i+MAX_STOCK_BATCH], all_wh_ids)
+            for i in range(0, len(skus), MAX_STOCK_BATCH)
+        ]
+        # сливаем в порядке пачек каталога, а не завершения запросов: порядок inventory
+        # (и SKU с одинаковым offer_id в выгрузке) не зависит от сети
+        for future in futures:
+            for item in future.result():
                 sku_val = item.get("sku")
-                if sku_val is None: continue
-                inventory.setdefault(int(sku_val), {})[int(wh_id)] = {
-                    "available_stock_count": item.get("available_stock_count",0),
-                    "transit_stock_count": item.get("transit_stock_count",0),
-                    "requested_stock_count": item.get("requested_stock_count",0),
-                }
+                wh_id = item.get("warehouse_id")
+                if sku_val is None or wh_id is None: continue
+                inventory[(int(sku_val), int(wh_id))] = (
+                    item.get("available_stock_count",0),
+                    item.get("transit_stock_count",0),
+                    item.get("requested_stock_count",0),
+                )
     return inventory, product_meta, clusters
 
+def index_skus_by_warehouse(product_meta: ProductMeta, inventory) -> Dict[int, List[int]]:
+    """Обратный индекс склад -> SKU, отсортированные по артикулу (offer_id)."""
+    sku_to_idx, offer_ids = product_meta.sku_to_idx, product_meta.offer_ids
+    sku_to_whs: Dict[int, List[int]] = {}
+    for sku, wh_id in inventory:  # учитываем все товары, даже с нулем
+        sku_to_whs.setdefault(sku, []).append(wh_id)
+
+    # Сортируем весь каталог по артикулу один раз и раскладываем SKU по складам в этом
+    # порядке — списки складов получаются уже отсортированными, без сортировки на каждый склад
+    wh_to_skus: Dict[int, List[int]] = {}
+    for sku in sorted(sku_to_idx, key=lambda s: offer_ids[sku_to_idx[s]]):
+        for wh_id in sku_to_whs.get(sku, ()):
+            wh_to_skus.setdefault(wh_id, []).append(sku)
+    return wh_to_skus
+
 # --------------------------
 # Excel export inventory
 # --------------------------
-def export_inventory_to_excel(product_meta, inventory, clusters, filename="ozon_inventory.xlsx"):
-    wb = Workbook()
-    wb.remove(wb.active)
+def _unique_sheet_title(name: str, used: set) -> str:
+    """Имя листа в пределах 31 символа; повторы (без учёта регистра) получают числовой суффикс."""
+    # Excel не допускает в имени листа []:*?/\ и апострофы по краям
+    # (обрезку по длине делаем до снятия апострофов, иначе апостроф может оказаться на краю)
+    name = re.sub(r"[\[\]:*?/\\]", "_", name)
+    title = name[:31].strip("'") or "Sheet"
+    n = 0
+    while title.lower() in used:
+        n += 1
+        suffix = str(n)
+        title = (name[:31 - len(suffix)].strip("'") or "Sheet") + suffix
+    used.add(title.lower())
+    return title
+
+def export_inventory_to_excel(product_meta, inventory, clusters, filename="ozon_inventory.xlsx", wh_to_skus=None):
+    if wh_to_skus is None:
+        wh_to_skus = index_skus_by_warehouse(product_meta, inventory)
+    # constant_memory: строки сразу сбрасываются на диск, в памяти держится только текущая
+    wb = xlsxwriter.Workbook(filename, {"constant_memory": True, "strings_to_numbers": False})
     headers = ["Склад", "Артикул", "В наличии", "В пути", "В заявке"]
-    red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+    red_fmt = wb.add_format({"bg_color": "#FFC7CE"})
+    bold_fmt = wb.add_format({"bold": True})
+
+    # Суммарное наличие по каждому складу — только по реально заполненным SKU склада
+    wh_totals: Dict[int, int] = {
+        wh_id: sum(inventory[(sku, wh_id)][0] for sku in skus)
+        for wh_id, skus in wh_to_skus.items()
+    }
 
     # Считаем суммарное наличие товаров в кластере
     cluster_sums = []
@@ -203,99 +400,82 @@ def export_inventory_to_excel(product_meta, inventory, clusters, filename="ozon_
         for lc in logistic_clusters:
             for wh in lc.get("warehouses", []):
                 wh_id = wh.get("warehouse_id") or wh.get("id")
-                for sku in product_meta.keys():
-                    total_stock += inventory.get(sku, {}).get(int(wh_id), {}).get("available_stock_count", 0)
+                total_stock += wh_totals.get(int(wh_id), 0)
         cluster_sums.append((cluster, total_stock))
 
     # Сортировка кластеров по суммарному наличию (убывание)
     cluster_sums.sort(key=lambda x: x[1], reverse=True)
 
+    # локальные ссылки — в горячих циклах без поиска атрибутов
+    inv_get = inventory.get
+    sku_to_idx, names, offer_ids = product_meta
+
+    # xlsxwriter не переименовывает совпадающие листы сам (в отличие от openpyxl)
+    used_titles: set = set()
     for cluster, _ in cluster_sums:
         cluster_name = cluster.get("name", "?")
-        ws = wb.create_sheet(title=cluster_name[:31])
-        ws.append(headers)
-        ws.auto_filter.ref = "A1:E1"
-        ws.freeze_panes = "A2"
-        ws.sheet_properties.outlinePr.showSummaryBelow = True
-        row = 2
+        ws = wb.add_worksheet(_unique_sheet_title(cluster_name, used_titles))
+        ws.write_row(0, 0, headers)
+        ws.autofilter(0, 0, 0, len(headers) - 1)
+        ws.freeze_panes(1, 0)
+        # constant_memory требует писать строки строго по порядку — row только растёт
+        row = 1
 
         logistic_clusters = cluster.get("logistic_clusters", [])
         for lc in logistic_clusters:
             for wh in lc.get("warehouses", []):
                 wh_id = wh.get("warehouse_id") or wh.get("id")
                 wh_name = wh.get("name", "?")
-                skus_in_wh = [
-                    sku for sku in product_meta.keys()
-                    if wh_id in inventory.get(sku, {})  # учитываем все товары, даже с нулем
-                ]
-                if not skus_in_wh:
+                # SKU склада уже отсортированы по артикулу (offer_id)
+                wh_id_int = int(wh_id)
+                sorted_skus = wh_to_skus.get(wh_id_int, [])
+                if not sorted_skus:
                     continue
 
                 # Суммируем наличие на складе
-                total_stock = sum(inventory.get(sku, {}).get(int(wh_id), {}).get("available_stock_count", 0) for sku in skus_in_wh)
+                total_stock = wh_totals.get(wh_id_int, 0)
 
                 # Добавляем склад
-                ws.append([f"{wh_name} (в наличии: {total_stock})"] + [""] * (len(headers) - 1))
-                ws.cell(row=row, column=1).font = Font(bold=True)
-                start_row = row + 1
+                ws.write(row, 0, f"{wh_name} (в наличии: {total_stock})", bold_fmt)
                 row += 1
 
-                # Сортируем товары по артикулу (offer_id)
-                sorted_skus = sorted(
-                    skus_in_wh,
-                    key=lambda s: product_meta.get(s, {}).get("offer_id", "")
-                )
-
                 for sku in sorted_skus:
-                    stock_data = inventory.get(sku, {}).get(int(wh_id), {})
-                    ws.append([
-                        product_meta.get(sku, {}).get("name", ""),
-                        product_meta.get(sku, {}).get("offer_id", ""),
-                        stock_data.get("available_stock_count", 0),
-                        stock_data.get("transit_stock_count", 0),
-                        stock_data.get("requested_stock_count", 0)
-                    ])
-                    if stock_data.get("available_stock_count", 0) == 0:
-                        for c in range(1, 6):
-                            ws.cell(row=row, column=c).fill = red_fill
+                    available, transit, requested = inv_get((sku, wh_id_int), (0, 0, 0))
+                    i = sku_to_idx[sku]
+                    # Сгруппируем строки с товарами под складом (свернуты по умолчанию)
+                    ws.set_row(row, None, None, {"level": 1, "hidden": True})
+                    ws.write_row(row, 0, (names[i], offer_ids[i], available, transit, requested),
+                                 red_fmt if available == 0 else None)
                     row += 1
 
-                # Сгруппируем строки с товарами под складом
-                for r in range(start_row, row):
-                    ws.row_dimensions[r].outlineLevel = 1
-                    ws.row_dimensions[r].hidden = True  # свернуты по умолчанию
-
-    wb.save(filename)
+    wb.close()
 # --------------------------
 # Excel export orders summary
 # --------------------------
 def export_orders_summary_to_excel(client: OzonClient, filename="ozon_last_3_months.xlsx"):
     since = datetime.now() - timedelta(days=90)
     to = datetime.now()
-    orders = client.get_orders(since, to)
-    summary: Dict[str,int] = {}
-    for order in orders:
+    # заказы обрабатываем потоком — в памяти остаются только суммы по артикулам
+    summary: Counter = Counter()
+    for order in client.iter_orders(since, to):
         for item in order.get("products", []):
             sku = item.get("offer_id") or item.get("sku")
             if sku:
-                summary[sku] = summary.get(sku,0) + int(item.get("quantity",1))
+                summary[sku] += int(item.get("quantity",1))
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Заказы 3 месяца"
-    ws.append(["Артикул", "Заказы за последние 3 месяца"])
-    ws.freeze_panes = "A2"
-    red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+    wb = xlsxwriter.Workbook(filename, {"constant_memory": True, "strings_to_numbers": False})
+    ws = wb.add_worksheet("Заказы 3 месяца")
+    ws.write_row(0, 0, ["Артикул", "Заказы за последние 3 месяца"])
+    ws.freeze_panes(1, 0)
+    red_fmt = wb.add_format({"bg_color": "#FFC7CE"})
 
     # Сортируем по артикулу
-    for sku in sorted(summary.keys()):
+    for row, sku in enumerate(sorted(summary.keys()), start=1):
         count = summary[sku]
-        ws.append([sku, count])
-        if count == 0:
-            row = ws.max_row
-            ws.cell(row=row, column=2).fill = red_fill
+        ws.write(row, 0, sku)
+        ws.write(row, 1, count, red_fmt if count == 0 else None)
 
-    wb.save(filename)
+    wb.close()
 
 # --------------------------
 # Main
@@ -303,12 +483,16 @@ def export_orders_summary_to_excel(client: OzonClient, filename="ozon_last_3_mon
 if __name__ == "__main__":
     client_id = _require_env(OZON_CLIENT_ID, "OZON_CLIENT_ID")
     api_key = _require_env(OZON_API_KEY, "OZON_API_KEY")
-    client = OzonClient(client_id, api_key)
-
-    print("Собираем инвентарь...")
-    inventory, product_meta, clusters = gather_inventory_by_warehouses(client)
-    print("Экспортируем инвентарь в Excel...")
-    export_inventory_to_excel(product_meta, inventory, clusters, "ozon_inventory.xlsx")
-    print("Экспортируем заказы за последние 3 месяца в Excel...")
-    export_orders_summary_to_excel(client, "ozon_last_3_months.xlsx")
+    client = OzonClient(client_id, api_key, cache_ttl=CACHE_TTL if OZON_CACHE else None)
+
+    # Заказы не зависят от инвентаря — выгружаем их в фоне, параллельно со сбором остатков
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        print("Экспортируем заказы за последние 3 месяца в Excel...")
+        orders_future = ex.submit(export_orders_summary_to_excel, client, "ozon_last_3_months.xlsx")
+        print("Собираем инвентарь...")
+        inventory, product_meta, clusters = gather_inventory_by_warehouses(client)
+        wh_to_skus = index_skus_by_warehouse(product_meta, inventory)
+        print("Экспортируем инвентарь в Excel...")
+        export_inventory_to_excel(product_meta, inventory, clusters, "ozon_inventory.xlsx", wh_to_skus)
+        orders_future.result()
     print("Готово! Файлы ozon_inventory.xlsx и ozon_last_3_months.xlsx созданы.")
\ No newline at end of file